@@ -1,184 +1,473 @@
 import streamlit as st
 import pandas as pd
-from datetime import date, timedelta, datetime
+import numpy as np
+from datetime import date, timedelta, datetime, timezone
 import time # For last refresh time
-import matplotlib.pyplot as plt
 import os
 import pydeck as pdk
+import h3
+import pyarrow as pa
 import asyncio # Required for running async code if Streamlit doesn't auto-handle a context
-import aiohttp # Required for creating a session for async collector functions
+import atexit
+import threading
+import uuid
+import logging
+import importlib.machinery
+import multiprocessing
+import site
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# The collector logs through a module logger; without this its INFO messages are dropped.
+# basicConfig does nothing once the root logger has handlers, so reruns do not add new ones.
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 
 # Attempt to import project modules.
 # This assumes app.py is run from the root of the 'queimadas_monitor' project.
 try:
-    from data_collection.collector import fetch_daily_fire_csv, fetch_10min_fire_csv, fetch_all_10min_slots_for_day
+    from data_collection.collector import close_session, fetch_daily_fire_csv, fetch_10min_fire_csv, fetch_all_10min_slots_for_day
+    from data_collection.csv_reader import INPE_TIMESTAMP_FORMATS, read_table, read_table_ipc, table_from_ipc
     from config import RAW_DATA_DIR, RISK_LEVELS # RISK_LEVELS pode ser usado para ordenação ou filtros
     from risk_assessment.assessor import aplica_avaliacao_risco_df
 except ModuleNotFoundError:
     st.error("Error importing project modules. Ensure Streamlit is run from the 'queimadas_monitor' root folder.")
     st.stop() # Stop Streamlit script execution
 
-@st.cache_data # Cache to avoid reloading/reprocessing data unnecessarily
-def load_data(csv_path: str) -> pd.DataFrame | None:
-    """Loads data from a CSV file into a Pandas DataFrame."""
-    try:
-        # INPE files often use 'latin1' or 'iso-8859-1' encoding
-        # Try 'utf-8' first, then 'latin1' as a fallback
+def _parse_datetime_column(values: pd.Series, formats: list[str] = INPE_TIMESTAMP_FORMATS) -> pd.Series:
+    """Parses a date/time column trying the given formats before pandas' per-element inference."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values # Already converted by csv_reader
+    for fmt in formats:
         try:
-            df = pd.read_csv(csv_path, encoding='utf-8')
-        except UnicodeDecodeError:
-            df = pd.read_csv(csv_path, encoding='latin1')
-        
-        # Standardize and convert date/time columns
-        date_col_found = False
-        # Common date/time column names in INPE files
-        possible_date_cols = {'datahora': 'event_datetime', 'data_hora_gmt': 'event_datetime', 'data': 'event_datetime'}
-        df.rename(columns=possible_date_cols, inplace=True)
-
-        if 'event_datetime' in df.columns:
-            try:
-                df['event_datetime'] = pd.to_datetime(df['event_datetime'])
-                df['data_ocorrencia'] = df['event_datetime'].dt.date
-                df['hora_ocorrencia'] = df['event_datetime'].dt.hour
-                date_col_found = True
-            except Exception as e:
-                st.warning(f"Could not convert 'event_datetime' column to datetime: {e}")
-        
-        if not date_col_found:
-            # Attempt to find any column that looks like a date if standard ones fail
-            for col in df.columns:
-                if 'date' in col.lower() or 'data' in col.lower() or 'time' in col.lower() or 'hora' in col.lower():
-                    try:
-                        # A more robust check or specific parsing might be needed here
-                        df['event_datetime'] = pd.to_datetime(df[col])
-                        df['data_ocorrencia'] = df['event_datetime'].dt.date
-                        df['hora_ocorrencia'] = df['event_datetime'].dt.hour
-                        st.info(f"Used column '{col}' as 'event_datetime'.")
-                        date_col_found = True
-                        break
-                    except Exception:
-                        continue # Try next potential date column
-            if not date_col_found:
-                 st.warning("No primary date/time column ('datahora', 'data_hora_gmt', 'data') found or processed as 'event_datetime'.")
-
-
-        # Ensure lat/lon are numeric
-        for col_coord in ['lat', 'latitude', 'lon', 'longitude']:
-            if col_coord in df.columns:
-                df[col_coord] = pd.to_numeric(df[col_coord], errors='coerce')
-        
-        # Standardize lat/lon column names
-        df.rename(columns={'latitude': 'lat', 'longitude': 'lon'}, inplace=True)
+            return pd.to_datetime(values, format=fmt, cache=True, errors='raise')
+        except ValueError:
+            continue
+    return pd.to_datetime(values, format='mixed', cache=True)
+
+def _add_date_parts(df: pd.DataFrame) -> None:
+    """
+    Derives 'data_ocorrencia' (datetime64[D]) and 'hora_ocorrencia' (int16) from 'event_datetime'
+    with integer arithmetic on the underlying ticks, never creating a Python date per row.
+    """
+    vals = df['event_datetime'].values
+    unit, _ = np.datetime_data(vals.dtype) # Arrow-backed reads may be in s/ms/us rather than ns
+    ticks = vals.view('i8')
+    ticks_per_hour = np.timedelta64(1, 'h') // np.timedelta64(1, unit)
+    missing = np.isnat(vals)
+    days = ticks // (24 * ticks_per_hour)
+    days[missing] = np.iinfo(np.int64).min # NaT
+    df['data_ocorrencia'] = days.view('datetime64[D]')
+    hours = (ticks // ticks_per_hour % 24).astype('int16')
+    if missing.any():
+        df['hora_ocorrencia'] = pd.Series(hours, index=df.index, dtype='Int16').mask(missing)
+    else:
+        df['hora_ocorrencia'] = hours
 
-        return df
-    except FileNotFoundError:
+@st.cache_data(show_spinner=False) # Cache to avoid reparsing files; no spinner so it can run in worker threads
+def _load_table(csv_path: str) -> pa.Table:
+    """Cached read_table."""
+    return read_table(csv_path)
+
+def _report_load_error(csv_path: str, error: BaseException) -> None:
+    """Shows in the app why a CSV file could not be loaded."""
+    if isinstance(error, FileNotFoundError):
         st.error(f"CSV file not found at: {csv_path}")
-        return None
-    except pd.errors.EmptyDataError:
+    elif isinstance(error, pd.errors.EmptyDataError):
         st.warning(f"The CSV file is empty: {csv_path}")
-        return None
+    else:
+        st.error(f"Error loading CSV ({csv_path}): {error}")
+
+CATEGORY_COLS = ['estado', 'bioma', 'municipio', 'satelite']
+
+def _categorize_labels(df: pd.DataFrame) -> None:
+    """Stores low-cardinality labels as categories (integer codes instead of repeated strings), in place."""
+    for col_cat in CATEGORY_COLS:
+        if col_cat in df.columns and not isinstance(df[col_cat].dtype, pd.CategoricalDtype):
+            df[col_cat] = df[col_cat].astype('category')
+
+def _table_to_df(table: pa.Table) -> pd.DataFrame:
+    """Converts a table of INPE fire spots to pandas and standardizes its date/time and coordinate columns."""
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+
+    # Convert date/time columns (already renamed to 'event_datetime' by _standardize_column_names)
+    date_col_found = False
+
+    if 'event_datetime' in df.columns:
+        try:
+            df['event_datetime'] = _parse_datetime_column(df['event_datetime'])
+            _add_date_parts(df)
+            date_col_found = True
+        except Exception as e:
+            st.warning(f"Could not convert 'event_datetime' column to datetime: {e}")
+    
+    if not date_col_found:
+        # Attempt to find any column that looks like a date if standard ones fail
+        for col in df.columns:
+            if 'date' in col.lower() or 'data' in col.lower() or 'time' in col.lower() or 'hora' in col.lower():
+                try:
+                    # A more robust check or specific parsing might be needed here
+                    df['event_datetime'] = _parse_datetime_column(df[col])
+                    _add_date_parts(df)
+                    st.info(f"Used column '{col}' as 'event_datetime'.")
+                    date_col_found = True
+                    break
+                except Exception:
+                    continue # Try next potential date column
+        if not date_col_found:
+             st.warning("No primary date/time column ('datahora', 'data_hora_gmt', 'data') found or processed as 'event_datetime'.")
+
+
+    # Ensure lat/lon/frp are numeric, downcast to float32 to halve their memory
+    for col_num in ['lat', 'lon', 'frp']:
+        if col_num in df.columns:
+            df[col_num] = pd.to_numeric(df[col_num], errors='coerce', downcast='float')
+
+    _categorize_labels(df)
+    return df
+
+def _combine_tables(tables: list[pa.Table]) -> pd.DataFrame:
+    """Concatenates per-file tables in Arrow and converts the result to pandas only once."""
+    try:
+        combined = pa.concat_tables(tables, promote_options='permissive').combine_chunks()
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Column types that cannot be unified across files: standardize each file in pandas instead.
+        # Categories with different sets come out of pd.concat as plain strings, so they are rebuilt
+        df = pd.concat([_table_to_df(table) for table in tables], ignore_index=True)
+        _categorize_labels(df)
+        return df
+    return _table_to_df(combined)
+
+@st.cache_resource
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop for network I/O shared by every rerun and session, running forever in a background thread.
+    The collector's shared aiohttp session is bound to the loop that created it, so running every fetch on this
+    loop keeps its connection pool, DNS cache and keep-alives across reruns; coroutines are submitted to it
+    from any thread (see on_shared_loop).
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="shared-io-loop", daemon=True).start()
+    atexit.register(_close_shared_session, loop)
+    return loop
+
+def on_shared_loop(coro) -> asyncio.Future:
+    """Schedules coro on the shared I/O loop; the result can be awaited from any other event loop."""
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_event_loop()))
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion on a loop of its own, in the calling script thread, so it can call Streamlit
+    and reruns of different sessions run concurrently. Network I/O inside it goes through on_shared_loop.
+    """
+    return asyncio.run(coro)
+
+def _close_shared_session(loop: asyncio.AbstractEventLoop) -> None:
+    """Closes the collector's shared session on interpreter shutdown, on the loop it is bound to."""
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout=5)
+
+# Streamlit installs this script as a __main__ module without __spec__, which makes multiprocessing re-run it
+# (the whole app) in every spawned worker. A spec named __main__ tells spawn there is no main module to re-import.
+_MAIN_SPEC = importlib.machinery.ModuleSpec("__main__", None)
+__spec__ = _MAIN_SPEC
+
+@st.cache_resource
+def _get_process_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes for parsing daily CSVs, shared across reruns. Spawned, not forked: forking the
+    multithreaded server can leave a child holding a lock (allocator, import, thread pools) that no thread will release.
+    The workers only need the Streamlit-free csv_reader module, found through the project folder added to their path.
+    """
+    max_workers = os.cpu_count() or 4
+    pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=site.addsitedir, initargs=(os.path.dirname(os.path.abspath(__file__)),))
+    # Workers read sys.modules['__main__'] when they are launched, and every rerun installs a fresh one that gets
+    # its spec only when it reaches the line above. So all workers are launched now, in one go, with the spec
+    # set on whichever __main__ is current, rather than lazily on later submits.
+    main_module = sys.modules['__main__']
+    if getattr(main_module, '__spec__', None) is None:
+        main_module.__spec__ = _MAIN_SPEC
+    wait([pool.submit(os.getpid) for _ in range(max_workers)])
+    return pool
+
+def _parse_in_worker(csv_path: str) -> pa.Table:
+    """Parses a CSV in the process pool, replacing the pool once if a worker died (BrokenProcessPool)."""
+    try:
+        return table_from_ipc(_get_process_pool().submit(read_table_ipc, csv_path).result())
+    except BrokenProcessPool:
+        # A broken pool rejects every later submit: drop it so the next call starts a fresh one
+        _get_process_pool.clear()
+        return table_from_ipc(_get_process_pool().submit(read_table_ipc, csv_path).result())
+
+class DayParseError(Exception):
+    """A daily CSV was downloaded but could not be parsed; keeps its path for _report_load_error."""
+    def __init__(self, csv_path: str, error: BaseException):
+        super().__init__(csv_path, error)
+        self.csv_path = csv_path
+        self.error = error
+
+def _fetch_and_read_day(target_date: date) -> pa.Table:
+    """
+    Downloads and parses the daily CSV of one day. Runs in a worker thread: the download is scheduled
+    on the shared I/O loop and the parsing in a worker process, so several days are parsed in parallel without the GIL.
+    """
+    csv_path = asyncio.run_coroutine_threadsafe(fetch_daily_fire_csv(target_date), _get_event_loop()).result()
+    if csv_path is None or not os.path.exists(csv_path):
+        # Raise instead of returning None so the failure is not cached by load_day
+        raise OSError(f"Could not download the daily CSV for {target_date.strftime('%d/%m/%Y')}.")
+    try:
+        return _parse_in_worker(csv_path)
     except Exception as e:
-        st.error(f"Error loading CSV ({csv_path}): {e}")
-        return None
+        raise DayParseError(csv_path, e) from e
+
+# INPE keeps completing a daily file after its day ends (and its dates are UTC, not the server's local time),
+# so only days at least this many days behind today's UTC date are considered final and cached
+DAILY_CACHE_MARGIN_DAYS = 2
+
+def is_final_day(target_date: date) -> bool:
+    """Whether INPE's daily file for target_date is old enough to no longer change."""
+    return target_date <= datetime.now(timezone.utc).date() - timedelta(days=DAILY_CACHE_MARGIN_DAYS)
+
+@st.cache_data(persist="disk", show_spinner=False)
+def load_day(target_date: date) -> pa.Table:
+    """
+    Daily data of a final day (see is_final_day), cached on disk so moving the report window only fetches
+    the new days. Persisted entries never expire, hence the margin. Same threading requirements as _fetch_and_read_day.
+    """
+    return _fetch_and_read_day(target_date)
 
-# @st.cache_data # Cache to avoid re-downloads if files already exist - REMOVED FOR NOW
 async def fetch_data_for_range(start_date: date, end_date: date) -> pd.DataFrame | None:
     """Downloads and combines data for a date range using async collector."""
-    all_dfs = []
+    all_tables = []
     status_messages = []
     
     progress_bar = st.progress(0)
     num_days = (end_date - start_date).days + 1
     
-    async with aiohttp.ClientSession() as session: # Create session for async calls
-        tasks = []
-        for i in range(num_days):
-            current_date_iter = start_date + timedelta(days=i)
-            tasks.append(fetch_daily_fire_csv(current_date_iter, session))
-
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for i, result in enumerate(results):
-            current_date_iter = start_date + timedelta(days=i)
-            status_messages.append(f"Processing data for {current_date_iter.strftime('%d/%m/%Y')}...")
-            # st.text("\n".join(status_messages[-1:])) # Can be noisy, consider logging instead or a single status line
-
-            if isinstance(result, str) and os.path.exists(result):
-                df_day = load_data(result) # load_data is sync
-                if df_day is not None and not df_day.empty:
-                    all_dfs.append(df_day)
-                elif df_day is not None and df_day.empty:
-                    status_messages.append(f"  -> No fire spots registered for {current_date_iter.strftime('%d/%m/%Y')}.")
-                    # st.text("\n".join(status_messages[-1:]))
-            elif isinstance(result, Exception):
-                st.warning(f"Failed to fetch data for {current_date_iter.strftime('%d/%m/%Y')}: {result}")
-            
-            progress_bar.progress((i + 1) / num_days)
+    # Each day is handled by a worker thread that downloads it and waits for the process pool to parse it;
+    # final days come from the load_day cache.
+    # Recent files are still being updated by INPE, so they are never cached. Streamlit calls stay in this thread.
+    days = [start_date + timedelta(days=i) for i in range(num_days)]
+    day_tasks = [asyncio.to_thread(load_day if is_final_day(day) else _fetch_and_read_day, day) for day in days]
+    results = await asyncio.gather(*day_tasks, return_exceptions=True)
+
+    for i, result in enumerate(results):
+        current_date_iter = days[i]
+        status_messages.append(f"Processing data for {current_date_iter.strftime('%d/%m/%Y')}...")
+        # st.text("\n".join(status_messages[-1:])) # Can be noisy, consider logging instead or a single status line
+
+        if isinstance(result, DayParseError):
+            _report_load_error(result.csv_path, result.error)
+        elif isinstance(result, Exception):
+            st.warning(f"Failed to fetch data for {current_date_iter.strftime('%d/%m/%Y')}: {result}")
+        elif result.num_rows > 0:
+            all_tables.append(result)
+        else:
+            status_messages.append(f"  -> No fire spots registered for {current_date_iter.strftime('%d/%m/%Y')}.")
+            # st.text("\n".join(status_messages[-1:]))
+        
+        progress_bar.progress((i + 1) / num_days)
     
     # Clear progress bar and status messages after completion
     # progress_bar.empty() # Or set to 1.0
     # st.empty() # To clear st.text messages if they were in a placeholder
 
-    if not all_dfs:
+    if not all_tables:
         st.error("No data was loaded for the selected range.")
         return None
     
-    combined_df = pd.concat(all_dfs, ignore_index=True)
+    combined_df = _combine_tables(all_tables)
     st.success(f"Data from {start_date.strftime('%d/%m/%Y')} to {end_date.strftime('%d/%m/%Y')} combined. Total of {len(combined_df)} fire spots.")
     return combined_df
 
 # @st.cache_data(ttl=600) # Cache for 10 minutes for aggregated 10min data - REMOVED FOR NOW
 async def load_and_combine_10min_data_for_days(days_list: list[date]) -> pd.DataFrame | None:
     """Loads and combines all 10-minute data for a list of days asynchronously."""
-    all_10min_dfs = []
+    all_10min_tables = []
     total_files_with_data = 0
     
     progress_text_area = st.empty() # Placeholder for dynamic status messages
     messages = []
 
-    async with aiohttp.ClientSession() as session: # Create session for async calls
-        for target_day in days_list:
-            messages.append(f"Fetching 10-min data for {target_day.strftime('%Y-%m-%d')}...")
-            progress_text_area.info("\n".join(messages)) # Use st.info or st.status for better UI
-            
-            list_of_files = await fetch_all_10min_slots_for_day(target_day, session)
-            
-            day_dfs_count = 0
-            if list_of_files: 
-                for file_path in list_of_files:
-                    df_slot = load_data(file_path) 
-                    if df_slot is not None and not df_slot.empty:
-                        all_10min_dfs.append(df_slot)
-                        day_dfs_count +=1
-            
-            if day_dfs_count > 0:
-                total_files_with_data += day_dfs_count
-                messages.append(f"  -> {day_dfs_count} files with data processed for {target_day.strftime('%Y-%m-%d')}.")
-            else:
-                messages.append(f"  -> No 10-min data files with content found for {target_day.strftime('%Y-%m-%d')}.")
-            progress_text_area.info("\n".join(messages))
+    for target_day in days_list:
+        messages.append(f"Fetching 10-min data for {target_day.strftime('%Y-%m-%d')}...")
+        progress_text_area.info("\n".join(messages)) # Use st.info or st.status for better UI
+        
+        # Downloads run on the shared I/O loop with the pooled session; this loop only awaits them
+        list_of_files = await on_shared_loop(fetch_all_10min_slots_for_day(target_day))
+        
+        day_dfs_count = 0
+        if list_of_files: 
+            # Parse the day's slot files in worker threads; Streamlit calls stay in this thread
+            parse_tasks = [asyncio.to_thread(_load_table, file_path) for file_path in list_of_files]
+            parsed_tables = await asyncio.gather(*parse_tasks, return_exceptions=True)
+            for file_path, table_slot in zip(list_of_files, parsed_tables):
+                if isinstance(table_slot, Exception):
+                    _report_load_error(file_path, table_slot)
+                elif table_slot.num_rows > 0:
+                    all_10min_tables.append(table_slot)
+                    day_dfs_count +=1
+        
+        if day_dfs_count > 0:
+            total_files_with_data += day_dfs_count
+            messages.append(f"  -> {day_dfs_count} files with data processed for {target_day.strftime('%Y-%m-%d')}.")
+        else:
+            messages.append(f"  -> No 10-min data files with content found for {target_day.strftime('%Y-%m-%d')}.")
+        progress_text_area.info("\n".join(messages))
 
     progress_text_area.empty() # Clear the status messages area
 
-    if not all_10min_dfs:
+    if not all_10min_tables:
         st.info("No 10-minute data found for the selected days.")
         return None
 
-    combined_df = pd.concat(all_10min_dfs, ignore_index=True)
+    combined_df = _combine_tables(all_10min_tables)
     if 'event_datetime' in combined_df.columns:
         combined_df = combined_df.sort_values(by='event_datetime', ascending=False)
     st.success(f"Total of {len(combined_df)} 10-minute fire spots loaded from {total_files_with_data} files.")
     return combined_df
 
+# Sessions leave no hook when they end, so a session's slots are dropped once it has not touched them for
+# SESSION_IDLE_TTL; however many sessions there are, one in use never loses its frames to another
+SESSION_IDLE_TTL = timedelta(hours=2)
+
+@st.cache_resource
+def _session_slots() -> tuple[dict, threading.Lock]:
+    """
+    Process-wide {(session_key, kind): [last_access, slot]}, shared by every session. cache_resource hands back
+    the same dict on every rerun, so large frames are neither copied nor serialized between interactions.
+    """
+    return {}, threading.Lock()
+
+def _df_slot(kind: str, replace_with: dict | None = None) -> dict:
+    """
+    This session's slot of the given kind, marked as just used, after dropping the slots of idle sessions.
+    A dropped slot comes back empty, and the tab then asks for the data to be generated again.
+    """
+    slots, lock = _session_slots()
+    now = time.monotonic()
+    with lock:
+        idle = [key for key, (last_access, _) in slots.items() if now - last_access > SESSION_IDLE_TTL.total_seconds()]
+        for key in idle:
+            del slots[key]
+        entry = slots.setdefault((st.session_state.session_key, kind), [now, {}])
+        entry[0] = now
+        if replace_with is not None:
+            entry[1] = replace_with
+        return entry[1]
+
+def get_session_df(kind: str) -> pd.DataFrame | None:
+    """Returns the current DataFrame of the given kind ("daily" or "10min") for this session."""
+    return _df_slot(kind).get("df")
+
+def get_session_view(kind: str, name: str) -> pd.DataFrame | None:
+    """Returns a view derived from the current DataFrame of the given kind (e.g. the map sample)."""
+    return _df_slot(kind).get(name)
+
+def set_session_df(kind: str, df: pd.DataFrame | None, **views: pd.DataFrame | None) -> None:
+    """Stores a new DataFrame of the given kind, plus any views derived from it, replacing the previous version."""
+    st.session_state[f"{kind}_version"] += 1
+    _df_slot(kind, replace_with=dict(df=df, **views))
+
+MAX_POINTS_ON_MAP = 10000
+
+def sample_map_points(df: pd.DataFrame) -> pd.DataFrame | None:
+    """Valid lat/lon pairs of df, sampled down to MAX_POINTS_ON_MAP rows. Computed once per load, not per render."""
+    if 'lat' not in df.columns or 'lon' not in df.columns:
+        return None
+    map_data = df[['lat', 'lon']].dropna()
+    if len(map_data) > MAX_POINTS_ON_MAP:
+        map_data = map_data.sample(MAX_POINTS_ON_MAP, random_state=42)
+    return map_data.reset_index(drop=True)
+
+def map_points_key(kind: str) -> str:
+    """Identifies the current points of the given kind; changes whenever set_session_df stores a new frame."""
+    return f"{st.session_state.session_key}-{kind}-{st.session_state[f'{kind}_version']}"
+
+@st.cache_resource(max_entries=32)
+def build_map(points_key: str, _lats: np.ndarray, _lons: np.ndarray) -> pdk.Deck:
+    """
+    Scatterplot of fire spots, built once per points_key. The arrays are not hashed; the key stands for them.
+    Reusing the Deck also keeps its layer id stable between reruns, so the browser does not rebuild the map.
+    """
+    points = pd.DataFrame({'lat': _lats.astype(np.float32, copy=False), 'lon': _lons.astype(np.float32, copy=False)})
+    return pdk.Deck(
+        layers=[pdk.Layer(
+            "ScatterplotLayer",
+            data=points,
+            get_position=['lon', 'lat'],
+            get_fill_color=[255, 75, 75, 160],
+            get_radius=3000,
+            radius_min_pixels=2,
+        )],
+        initial_view_state=pdk.ViewState(latitude=float(_lats.mean()), longitude=float(_lons.mean()), zoom=3),
+    )
+
+H3_RESOLUTION = 5 # Cells of roughly 250 km²
+
+@st.cache_resource(max_entries=32)
+def build_risk_hex_map(points_key: str, _points: pd.DataFrame) -> pdk.Deck:
+    """
+    Risk map of _points (lat, lon, criticidade, frp) aggregated into H3 cells, built once per points_key.
+    Each cell carries its spot count, highest risk level and highest FRP, so the browser gets one row per cell.
+    """
+    COLOR_TABLE = {
+        "Crítico": [255, 0, 0, 200],  # Red
+        "Alto": [255, 165, 0, 180],   # Orange
+        "Médio": [255, 255, 0, 160],  # Yellow
+    }
+    DEFAULT_COLOR = [0, 255, 0, 100]  # Green (Low)
+    levels = list(RISK_LEVELS.keys()) # Ordered from lowest to highest risk
+    palette = np.array([COLOR_TABLE.get(level, DEFAULT_COLOR) for level in levels], dtype=np.uint8)
+
+    lats = _points['lat'].to_numpy(dtype=np.float64)
+    lons = _points['lon'].to_numpy(dtype=np.float64)
+    cells = [h3.latlng_to_cell(lat, lon, H3_RESOLUTION) for lat, lon in zip(lats, lons)]
+    # Unknown levels count as the lowest one
+    risk_codes = np.maximum(pd.Index(levels).get_indexer(_points['criticidade']), 0)
+    hexes = (
+        pd.DataFrame({'cell': cells, 'risk_code': risk_codes, 'frp': pd.to_numeric(_points['frp'], errors='coerce').to_numpy()})
+        .groupby('cell', sort=False)
+        .agg(count=('risk_code', 'size'), risk_code=('risk_code', 'max'), frp=('frp', 'max'))
+        .reset_index()
+    )
+    hexes['criticidade'] = np.array(levels, dtype=object)[hexes['risk_code'].to_numpy()]
+    hexes['frp'] = hexes['frp'].round(1)
+    hexes[['r', 'g', 'b', 'a']] = palette[hexes['risk_code'].to_numpy()]
+
+    view_state = pdk.ViewState(latitude=float(lats.mean()), longitude=float(lons.mean()), zoom=3, pitch=50)
+    hexagon_layer = pdk.Layer(
+        "H3HexagonLayer",
+        data=hexes,
+        get_hexagon='cell',
+        get_fill_color=['r', 'g', 'b', 'a'],
+        extruded=False,
+        pickable=True,
+        stroked=False,
+    )
+    return pdk.Deck(
+        layers=[hexagon_layer],
+        initial_view_state=view_state,
+        tooltip={
+            "html": "<b>Fire spots:</b> {count}<br/><b>Max FRP:</b> {frp}<br/>"
+                    "<b>Criticidade:</b> {criticidade}",
+            "style": {"color": "white"}
+        }
+    )
+
 # --- Main App ---
 st.set_page_config(layout="wide", page_title="INPE Fire Spot Monitor")
 st.title("🔥 INPE Fire Spot Monitor")
 
 # Initialize session state for assessed data if not already present
-if 'df_total_daily_assessed' not in st.session_state:
-    st.session_state.df_total_daily_assessed = None
-if 'df_10min_aggregated' not in st.session_state: # This already exists from previous logic
-    st.session_state.df_10min_aggregated = None
+# Assessed data lives in _session_slots; session state only keeps the version of the current frames (see map_points_key)
+if 'session_key' not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex
+if 'daily_version' not in st.session_state:
+    st.session_state.daily_version = 0
+if '10min_version' not in st.session_state:
+    st.session_state['10min_version'] = 0
 if 'last_10min_refresh_time' not in st.session_state:
     st.session_state.last_10min_refresh_time = None
 
@@ -208,7 +497,7 @@ with tab1:
                                     max_value=today,
                                     key="daily_end_date")
 
-    # Helper async function to be called by asyncio.run()
+    # Helper async function to be called by run_async()
     async def _get_daily_report_data(start_dt: date, end_dt: date):
         return await fetch_data_for_range(start_dt, end_dt)
 
@@ -219,14 +508,14 @@ with tab1:
             st.subheader(f"Report for period: {start_date_daily.strftime('%d/%m/%Y')} to {end_date_daily.strftime('%d/%m/%Y')}")
             df_total_daily = None # Initialize
             with st.spinner("Fetching and combining daily data... Please wait."):
-                df_total_daily = asyncio.run(_get_daily_report_data(start_date_daily, end_date_daily))
+                df_total_daily = run_async(_get_daily_report_data(start_date_daily, end_date_daily))
             
             if df_total_daily is not None and not df_total_daily.empty:
                 with st.spinner("Assessing risk for daily data..."):
                     df_total_daily = aplica_avaliacao_risco_df(df_total_daily)
-                st.session_state.df_total_daily_assessed = df_total_daily # Store for alerts tab
+                set_session_df("daily", df_total_daily, map_sample=sample_map_points(df_total_daily)) # Store for alerts tab
             else:
-                st.session_state.df_total_daily_assessed = None # Clear if no data
+                set_session_df("daily", None) # Clear if no data
             
             # Use the locally scoped df_total_daily for immediate display
             if df_total_daily is not None and not df_total_daily.empty:
@@ -238,7 +527,7 @@ with tab1:
                 # Summary of risk levels
                 if 'criticidade' in df_total_daily.columns:
                     st.markdown("##### Risk Level Summary (Daily Data)")
-                    risk_counts_daily = df_total_daily['criticidade'].value_counts().reindex(list(RISK_LEVELS.keys()), fill_value=0)
+                    risk_counts_daily = df_total_daily.groupby('criticidade', observed=False).size().reindex(list(RISK_LEVELS.keys()), fill_value=0)
                     st.bar_chart(risk_counts_daily)
 
                 st.markdown("---")
@@ -248,14 +537,14 @@ with tab1:
                 with analysis_cols[0]:
                     if 'estado' in df_total_daily.columns:
                         st.markdown("##### Fire Spots by State")
-                        focos_por_estado = df_total_daily['estado'].value_counts().sort_values(ascending=False)
+                        focos_por_estado = df_total_daily.groupby('estado', observed=True, sort=False).size().sort_values(ascending=False)
                         st.bar_chart(focos_por_estado)
                     else:
                         st.warning("Column 'estado' not found.")
 
                     if 'bioma' in df_total_daily.columns:
                         st.markdown("##### Fire Spots by Biome")
-                        focos_por_bioma = df_total_daily['bioma'].value_counts().sort_values(ascending=False)
+                        focos_por_bioma = df_total_daily.groupby('bioma', observed=True, sort=False).size().sort_values(ascending=False)
                         st.bar_chart(focos_por_bioma)
                     else:
                         st.warning("Column 'bioma' not found.")
@@ -265,7 +554,7 @@ with tab1:
                         st.markdown("##### Fire Spots by Hour of Day (UTC)")
                         hora_data = df_total_daily['hora_ocorrencia'].dropna().astype(int)
                         if not hora_data.empty:
-                            focos_por_hora = hora_data.value_counts().sort_index()
+                            focos_por_hora = hora_data.groupby(hora_data.to_numpy()).size() # Sorted by hour
                             st.bar_chart(focos_por_hora)
                         else:
                             st.info("No valid hour of occurrence data.")
@@ -274,14 +563,13 @@ with tab1:
 
                     if 'frp' in df_total_daily.columns:
                         st.markdown("##### FRP Distribution (Fire Radiative Power)")
-                        frp_data = pd.to_numeric(df_total_daily['frp'], errors='coerce').dropna()
-                        if not frp_data.empty:
-                            fig, ax = plt.subplots()
-                            upper_frp_limit = frp_data.quantile(0.99) if frp_data.quantile(0.99) > frp_data.min() else frp_data.max()
-                            ax.hist(frp_data, bins=50, range=(frp_data.min(), upper_frp_limit)) 
-                            ax.set_title('FRP Distribution (up to 99th percentile)')
-                            ax.set_xlabel('FRP'); ax.set_ylabel('Frequency')
-                            st.pyplot(fig)
+                        frp_data = pd.to_numeric(df_total_daily['frp'], errors='coerce').dropna().to_numpy()
+                        if frp_data.size:
+                            frp_min, frp_p99 = float(frp_data.min()), float(np.quantile(frp_data, 0.99))
+                            upper_frp_limit = frp_p99 if frp_p99 > frp_min else float(frp_data.max())
+                            counts, edges = np.histogram(frp_data, bins=50, range=(frp_min, upper_frp_limit))
+                            st.bar_chart(pd.Series(counts, index=pd.Index(edges[:-1].round(1), name='FRP')), y_label='Frequency')
+                            st.caption('FRP Distribution (up to 99th percentile)')
                         else:
                             st.info("No valid FRP data for histogram.")
                     else:
@@ -289,14 +577,12 @@ with tab1:
 
                 if 'data_ocorrencia' in df_total_daily.columns:
                     st.markdown("##### Fire Spots per Day")
-                    df_total_daily['data_ocorrencia_dt'] = pd.to_datetime(df_total_daily['data_ocorrencia'])
-                    focos_por_dia = df_total_daily.groupby(df_total_daily['data_ocorrencia_dt'].dt.date).size()
+                    focos_por_dia = df_total_daily.groupby('data_ocorrencia', sort=True).size() # Indexed by datetime64 days
                     if not focos_por_dia.empty:
                         st.line_chart(focos_por_dia)
                         
                         st.markdown("##### Fire Spots per Week (Starts Monday)")
-                        focos_por_dia_ts = pd.Series(focos_por_dia.values, index=pd.to_datetime(focos_por_dia.index))
-                        focos_por_semana = focos_por_dia_ts.resample('W-MON').sum()
+                        focos_por_semana = focos_por_dia.resample('W-MON').sum()
                         if not focos_por_semana.empty:
                             st.bar_chart(focos_por_semana)
                         else:
@@ -309,13 +595,11 @@ with tab1:
                 if 'lat' in df_total_daily.columns and 'lon' in df_total_daily.columns:
                     st.markdown("---")
                     st.markdown("#### 🗺️ Map of Fire Spots (Daily Report)")
-                    map_data = df_total_daily[['lat', 'lon']].dropna()
-                    if not map_data.empty:
-                        MAX_POINTS_ON_MAP = 10000 
-                        map_data_display = map_data.sample(min(len(map_data), MAX_POINTS_ON_MAP), random_state=42) if len(map_data) > MAX_POINTS_ON_MAP else map_data
-                        if len(map_data) > MAX_POINTS_ON_MAP:
-                             st.warning(f"Too many spots ({len(map_data)}) to display. Showing a sample of {MAX_POINTS_ON_MAP}.")
-                        st.map(map_data_display)
+                    map_data_display = get_session_view("daily", "map_sample")
+                    if map_data_display is not None and not map_data_display.empty:
+                        if len(df_total_daily) > MAX_POINTS_ON_MAP and len(map_data_display) == MAX_POINTS_ON_MAP:
+                             st.warning(f"Too many spots ({len(df_total_daily)}) to display. Showing a sample of {MAX_POINTS_ON_MAP}.")
+                        st.pydeck_chart(build_map(map_points_key("daily"), map_data_display['lat'].to_numpy(), map_data_display['lon'].to_numpy()))
                     else:
                         st.warning("No valid latitude/longitude data to display on map.")
 
@@ -331,7 +615,7 @@ with tab2:
 
     st.sidebar.header("⏱️ 10-Min Monitoring")
 
-    # Helper async function to be called by asyncio.run()
+    # Helper async function to be called by run_async()
     async def _get_10min_aggregated_data(days_to_fetch_list: list[date]):
         return await load_and_combine_10min_data_for_days(days_to_fetch_list)
 
@@ -342,13 +626,13 @@ with tab2:
         
         df_10min_temp = None # Initialize
         with st.spinner("Fetching all 10-minute data... This may take a while."):
-            df_10min_temp = asyncio.run(_get_10min_aggregated_data(days_to_fetch))
+            df_10min_temp = run_async(_get_10min_aggregated_data(days_to_fetch))
         
         if df_10min_temp is not None and not df_10min_temp.empty:
             with st.spinner("Assessing risk for 10-minute data..."):
-                st.session_state.df_10min_aggregated = aplica_avaliacao_risco_df(df_10min_temp)
+                set_session_df("10min", aplica_avaliacao_risco_df(df_10min_temp))
         else:
-            st.session_state.df_10min_aggregated = df_10min_temp # Store None or empty DF
+            set_session_df("10min", df_10min_temp) # Store None or empty DF
 
         st.session_state.last_10min_refresh_time = datetime.now()
         st.rerun()
@@ -356,7 +640,7 @@ with tab2:
     if st.session_state.last_10min_refresh_time:
         st.sidebar.caption(f"Last update: {st.session_state.last_10min_refresh_time.strftime('%d/%m/%Y %H:%M:%S')}")
 
-    df_10min_display = st.session_state.get('df_10min_aggregated')
+    df_10min_display = get_session_df("10min")
 
     if df_10min_display is not None and not df_10min_display.empty:
         st.subheader(f"Displaying {len(df_10min_display)} Fire Spots (Last 2 Days + Today's Slots)")
@@ -365,7 +649,7 @@ with tab2:
         # Summary of risk levels for 10-min data
         if 'criticidade' in df_10min_display.columns:
             st.markdown("##### Risk Level Summary (10-Min Data)")
-            risk_counts_10min = df_10min_display['criticidade'].value_counts().reindex(list(RISK_LEVELS.keys()), fill_value=0)
+            risk_counts_10min = df_10min_display.groupby('criticidade', observed=False).size().reindex(list(RISK_LEVELS.keys()), fill_value=0)
             st.bar_chart(risk_counts_10min)
 
         st.markdown("---")
@@ -373,7 +657,7 @@ with tab2:
         if 'lat' in df_10min_display.columns and 'lon' in df_10min_display.columns:
             map_data_10min_agg = df_10min_display[['lat', 'lon']].dropna()
             if not map_data_10min_agg.empty:
-                st.map(map_data_10min_agg)
+                st.pydeck_chart(build_map(map_points_key("10min"), map_data_10min_agg['lat'].to_numpy(), map_data_10min_agg['lon'].to_numpy()))
             else:
                 st.info("No latitude/longitude data for the map.")
         else:
@@ -381,50 +665,13 @@ with tab2:
 
 
         st.markdown("#### 🔥 PyDeck Map with Risk Coloring (10 min)")
-        print(df_10min_display.columns)
         if 'lat' in df_10min_display.columns and 'lon' in df_10min_display.columns and 'criticidade' in df_10min_display.columns:
-            pydeck_data = df_10min_display[['lat', 'lon', 'criticidade', 'frp', 'determined_biome_geo']].dropna(subset=['lat', 'lon'])
-            print(pydeck_data.head())
-            
-            if not pydeck_data.empty:
-                def get_pydeck_color(criticidade_level):
-                    if criticidade_level == "Crítico": return [255, 0, 0, 200]  # Red
-                    elif criticidade_level == "Alto": return [255, 165, 0, 180] # Orange
-                    elif criticidade_level == "Médio": return [255, 255, 0, 160] # Yellow
-                    else: return [0, 255, 0, 100]   # Green (Low)
-                
-                pydeck_data_colored = pydeck_data.copy()
-                pydeck_data_colored['color'] = pydeck_data_colored['criticidade'].apply(get_pydeck_color)
+            pydeck_data = df_10min_display[['lat', 'lon', 'criticidade', 'frp']].dropna(subset=['lat', 'lon'])
 
+            if not pydeck_data.empty:
                 try:
-                    view_state = pdk.ViewState(
-                        latitude=pydeck_data_colored['lat'].mean(),
-                        longitude=pydeck_data_colored['lon'].mean(),
-                        zoom=3, 
-                        pitch=50,
-                    )
-                    
-                    scatterplot_layer = pdk.Layer(
-                        "ScatterplotLayer",
-                        data=pydeck_data_colored,
-                        get_position=['lon', 'lat'],
-                        get_fill_color="color",
-                        get_radius=7000, # Adjust radius as needed (meters)
-                        pickable=True,
-                        radius_min_pixels=3,
-                        radius_max_pixels=30,
-                    )
-
-                    st.pydeck_chart(pdk.Deck(
-                        layers=[scatterplot_layer], 
-                        initial_view_state=view_state, 
-                        tooltip={
-                            "html": "<b>Lat:</b> {lat}<br/><b>Lon:</b> {lon}<br/>"
-                                    "<b>FRP:</b> {frp}<br/><b>Biome:</b> {determined_biome_geo}<br/>"
-                                    "<b>Criticidade:</b> {criticidade}",
-                            "style": {"color": "white"}
-                        }
-                    ))
+                    st.pydeck_chart(build_risk_hex_map(map_points_key("10min"), pydeck_data))
+                    st.caption(f"Fire spots grouped into H3 cells (resolution {H3_RESOLUTION}), colored by the highest risk level in each cell.")
                 except Exception as e:
                     st.error(f"Error generating PyDeck map: {e}")
                     st.write("Ensure 'lat', 'lon', and 'criticidade' columns exist and are valid.")
@@ -441,10 +688,13 @@ with tab2:
             st.write(f"  Min Longitude: {df_10min_display['lon'].min():.4f}, Max Longitude: {df_10min_display['lon'].max():.4f}")
 
             equator_approx = -10 
-            df_10min_display['simple_region'] = df_10min_display['lat'].apply(
-                lambda x: 'North/Midwest (approx.)' if x > equator_approx else 'South/Southeast/Northeast (approx.)'
-            )
-            spots_by_simple_region = df_10min_display['simple_region'].value_counts()
+            if 'simple_region' not in df_10min_display.columns: # Classified once per refresh; the frame lives in the session slot
+                lat = df_10min_display['lat'].to_numpy(dtype=np.float64, na_value=np.nan)
+                df_10min_display['simple_region'] = pd.Categorical.from_codes(
+                    (~(lat > equator_approx)).astype(np.int8), # Missing latitudes fall in the second region, as before
+                    categories=['North/Midwest (approx.)', 'South/Southeast/Northeast (approx.)']
+                )
+            spots_by_simple_region = df_10min_display.groupby('simple_region', observed=True, sort=False).size()
             st.markdown("##### Fire Spots by Approximate Region")
             st.bar_chart(spots_by_simple_region)
             st.caption(f"Division based on latitude > {equator_approx}° for 'North/Midwest (approx.)'. This is a very rough estimation.")
@@ -476,7 +726,7 @@ with tab3:
     # --- Daily Report Alerts Section ---
     st.markdown("---")
     st.subheader("Alertas do Relatório Diário")
-    df_daily_assessed = st.session_state.get('df_total_daily_assessed')
+    df_daily_assessed = get_session_df("daily")
     if df_daily_assessed is not None and not df_daily_assessed.empty:
         if 'criticidade' in df_daily_assessed.columns:
             alerts_daily_df = df_daily_assessed[df_daily_assessed['criticidade'].isin(selected_risk_levels)].copy()
@@ -496,7 +746,7 @@ with tab3:
     # --- 10-Min Monitoring Alerts Section ---
     st.markdown("---")
     st.subheader("Alertas do Monitoramento de 10 Minutos")
-    df_10min_assessed = st.session_state.get('df_10min_aggregated')
+    df_10min_assessed = get_session_df("10min")
     if df_10min_assessed is not None and not df_10min_assessed.empty:
         if 'criticidade' in df_10min_assessed.columns:
             alerts_10min_df = df_10min_assessed[df_10min_assessed['criticidade'].isin(selected_risk_levels)].copy()
@@ -2,15 +2,16 @@
 
 from datetime import date, timedelta, datetime
 import os
+import re
 import logging
+from email.utils import formatdate, parsedate_to_datetime
 import asyncio
 import aiohttp # Para requisições HTTP assíncronas
 import aiofiles # Para operações de arquivo assíncronas
-import pandas as pd
 
-# Configuração básica do logging.
-# Idealmente, a configuração do logging seria mais centralizada para um projeto maior.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+# Logger do módulo: a configuração (nível, formato) fica com quem usa o coletor, não com a biblioteca.
+# As mensagens usam formatação com %, feita só se o nível estiver habilitado.
+logger = logging.getLogger(__name__)
 
 # Tentativa de importar configurações.
 try:
@@ -28,18 +29,82 @@ except ModuleNotFoundError:
         sys.path.append(project_root_dir)
     from config import CSV_BASE_URL, RAW_DATA_DIR, CSV_10MIN_BASE_URL
 
+# Tamanho dos blocos lidos da resposta HTTP e gravados em disco: menos chamadas por arquivo baixado
+DOWNLOAD_CHUNK = 256 * 1024 # 256 KiB
+# Buffer de escrita do arquivo local: junta vários blocos por chamada de sistema
+WRITE_BUFFER = 1024 * 1024 # 1 MiB
+# Downloads de slots de 10min em andamento ao mesmo tempo; também é o limit_per_host da sessão de get_session()
+MAX_CONCURRENT_DOWNLOADS = 16
+# Bytes lidos do início de um arquivo baixado para verificar se ele tem dados
+PROBE_SIZE = 4096
+
+# Sessão HTTP compartilhada pelos fetchers quando nenhuma é passada: reaproveita conexões (keep-alive) e DNS
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Retorna a sessão compartilhada do módulo, criando-a na primeira chamada.
+    Uma sessão fica presa ao event loop que a criou, então é recriada se o loop mudar.
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, limit_per_host=MAX_CONCURRENT_DOWNLOADS, keepalive_timeout=60, ttl_dns_cache=300)
+        )
+        _session_loop = loop
+    return _session
+
+async def close_session() -> None:
+    """Fecha a sessão compartilhada, se houver. Deve ser chamada no mesmo loop que a criou."""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+# Diretórios já garantidos neste processo: ensure_dir só chama os.makedirs na primeira vez para cada um
+_dirs_ensured: set[str] = set()
+
 def ensure_dir(directory_path: str):
     """Garante que um diretório exista; se não, cria-o."""
+    if directory_path in _dirs_ensured:
+        return
     os.makedirs(directory_path, exist_ok=True)
-    logging.debug(f"Diretório garantido: {directory_path}")
+    _dirs_ensured.add(directory_path)
+    logger.debug("Diretório garantido: %s", directory_path)
+
+def _has_local_copy(local_file_path: str) -> bool:
+    """Indica se o arquivo já foi baixado (existe e não está vazio)."""
+    return os.path.exists(local_file_path) and os.path.getsize(local_file_path) > 0
+
+async def _save_response(response: aiohttp.ClientResponse, local_file_path: str) -> None:
+    """
+    Grava o corpo da resposta em local_file_path. Escreve primeiro num arquivo temporário, para que um download
+    interrompido não deixe um arquivo parcial que _has_local_copy tomaria por completo, e usa o Last-Modified
+    do servidor como data de modificação, base do If-Modified-Since da próxima requisição.
+    """
+    partial_path = f"{local_file_path}.part"
+    async with aiofiles.open(partial_path, 'wb', buffering=WRITE_BUFFER) as f:
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK):
+            await f.write(chunk)
+    last_modified = response.headers.get('Last-Modified')
+    if last_modified:
+        try:
+            mtime = parsedate_to_datetime(last_modified).timestamp()
+            os.utime(partial_path, (mtime, mtime))
+        except (TypeError, ValueError):
+            pass
+    os.replace(partial_path, local_file_path)
 
-async def fetch_daily_fire_csv(target_date: date, session: aiohttp.ClientSession) -> str | None:
+async def fetch_daily_fire_csv(target_date: date, session: aiohttp.ClientSession | None = None) -> str | None:
     """
     Baixa o arquivo CSV de focos de queimada para uma data específica do INPE.
 
     Args:
         target_date (date): A data para a qual o arquivo CSV será baixado.
-        session (aiohttp.ClientSession): The aiohttp session to use for requests.
+        session (aiohttp.ClientSession | None): The aiohttp session to use for requests (default: get_session()).
 
     Returns:
         str | None: O caminho para o arquivo CSV baixado, ou None em caso de erro.
@@ -51,185 +116,262 @@ async def fetch_daily_fire_csv(target_date: date, session: aiohttp.ClientSession
     ensure_dir(RAW_DATA_DIR)
     local_file_path = os.path.join(RAW_DATA_DIR, file_name)
 
-    logging.info(f"Tentando baixar dados de {target_date.strftime('%d/%m/%Y')} de: {file_url}")
+    logger.info("Tentando baixar dados de %s de: %s", target_date.strftime('%d/%m/%Y'), file_url)
+    if session is None:
+        session = await get_session()
+
+    # O arquivo diário continua sendo atualizado pelo INPE: com cópia local, só baixa de novo se ele mudou
+    headers = {}
+    if _has_local_copy(local_file_path):
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(local_file_path), usegmt=True)
 
     try:
-        async with session.get(file_url, timeout=60) as response:
+        async with session.get(file_url, timeout=60, headers=headers) as response:
+            if response.status == 304:
+                logger.info("Arquivo não modificado desde o último download, usando a cópia local: %s", local_file_path)
+                return local_file_path
             response.raise_for_status()
-            async with aiofiles.open(local_file_path, 'wb') as f:
-                while True:
-                    chunk = await response.content.read(8192) # 8KB chunks
-                    if not chunk:
-                        break
-                    await f.write(chunk)
-
-        logging.info(f"Arquivo baixado com sucesso e salvo em: {local_file_path}")
+            await _save_response(response, local_file_path)
+
+        logger.info("Arquivo baixado com sucesso e salvo em: %s", local_file_path)
         return local_file_path
 
     except aiohttp.ClientResponseError as http_err:
         if http_err.status == 404:
-            logging.warning(f"Arquivo não encontrado (404) para a data {target_date.strftime('%d/%m/%Y')}. URL: {file_url}")
+            logger.warning("Arquivo não encontrado (404) para a data %s. URL: %s", target_date.strftime('%d/%m/%Y'), file_url)
         else:
-            logging.error(f"Erro HTTP ao baixar o arquivo: {http_err} - URL: {file_url}")
+            logger.error("Erro HTTP ao baixar o arquivo: %s - URL: %s", http_err, file_url)
         return None
     except aiohttp.ClientConnectionError as conn_err:
-        logging.error(f"Erro de conexão ao tentar baixar o arquivo: {conn_err} - URL: {file_url}")
+        logger.error("Erro de conexão ao tentar baixar o arquivo: %s - URL: %s", conn_err, file_url)
         return None
     except asyncio.TimeoutError as timeout_err: # Specific for asyncio timeouts
-        logging.error(f"Timeout na requisição ao baixar o arquivo: {timeout_err} - URL: {file_url}")
+        logger.error("Timeout na requisição ao baixar o arquivo: %s - URL: %s", timeout_err, file_url)
         return None
     except aiohttp.ClientError as req_err: # General aiohttp client error
-        logging.error(f"Erro geral na requisição ao baixar o arquivo: {req_err} - URL: {file_url}")
+        logger.error("Erro geral na requisição ao baixar o arquivo: %s - URL: %s", req_err, file_url)
         return None
     except IOError as io_err:
-        logging.error(f"Erro de I/O ao salvar o arquivo {local_file_path}: {io_err}")
+        logger.error("Erro de I/O ao salvar o arquivo %s: %s", local_file_path, io_err)
+        return None
+
+def _has_data_rows(head: bytes) -> bool:
+    """Indica se o início de um CSV tem alguma linha não vazia depois do cabeçalho."""
+    _, _, rest = head.partition(b'\n')
+    return bool(rest.strip())
+
+def _validate_all(paths: list[str]) -> list[str]:
+    """Retorna, na mesma ordem, os arquivos de paths que existem e têm dados além do cabeçalho."""
+    files_with_data = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(PROBE_SIZE)
+        except OSError as e:
+            logger.error("Erro ao verificar o arquivo %s: %s", path, e)
+            continue
+        if not head:
+            logger.info("Arquivo %s está vazio (0 bytes), ignorando.", path)
+        elif _has_data_rows(head):
+            files_with_data.append(path)
+        else:
+            logger.info("Arquivo %s parece vazio (sem dados após cabeçalho), ignorando.", path)
+    return files_with_data
+
+def _10min_file_name(target_datetime: datetime) -> str:
+    """Nome do arquivo de 10min do INPE para o slot dado."""
+    return f"focos_10min_{target_datetime.strftime('%Y%m%d')}_{target_datetime.strftime('%H%M')}.csv"
+
+_ANY_10MIN_FILE = re.compile(r"focos_10min_\d{8}_\d{4}\.csv")
+
+async def _list_10min_files(target_date: date, session: aiohttp.ClientSession) -> set[str] | None:
+    """
+    Lê a listagem do diretório de 10min do INPE uma única vez e retorna os nomes dos arquivos do dia.
+    Retorna None se a listagem não puder ser obtida, e nesse caso todos os slots são tentados;
+    um conjunto vazio significa que nenhum slot do dia foi publicado.
+    """
+    pattern = re.compile(rf"focos_10min_{target_date.strftime('%Y%m%d')}_\d{{4}}\.csv")
+    try:
+        async with session.get(CSV_10MIN_BASE_URL, timeout=30) as response:
+            response.raise_for_status()
+            listing = await response.text(errors='replace')
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.info("Listagem de %s indisponível (%s); tentando todos os slots.", CSV_10MIN_BASE_URL, e)
         return None
+    # A page that names no 10min file of any day is not the directory listing (e.g. an error page)
+    if not _ANY_10MIN_FILE.search(listing):
+        logger.info("Resposta de %s não parece uma listagem de arquivos; tentando todos os slots.", CSV_10MIN_BASE_URL)
+        return None
+    return set(pattern.findall(listing))
 
-async def fetch_10min_fire_csv(target_datetime: datetime, session: aiohttp.ClientSession) -> str | None:
+async def fetch_10min_fire_csv(target_datetime: datetime, session: aiohttp.ClientSession | None = None) -> str | None:
     """
     Baixa o arquivo CSV de focos de queimada para uma data e hora (intervalo de 10 min) específica do INPE.
 
     Args:
         target_datetime (datetime): A data e hora para a qual o arquivo CSV será baixado (minuto múltiplo de 10).
-        session (aiohttp.ClientSession): The aiohttp session to use for requests.
+        session (aiohttp.ClientSession | None): The aiohttp session to use for requests (default: get_session()).
 
     Returns:
         str | None: O caminho para o arquivo CSV baixado, ou None em caso de erro.
     """
     if target_datetime.minute % 10 != 0:
-        logging.error(f"Minuto inválido para busca de 10min: {target_datetime.minute}. Deve ser múltiplo de 10.")
+        logger.error("Minuto inválido para busca de 10min: %s. Deve ser múltiplo de 10.", target_datetime.minute)
         return None
 
-    date_str_url = target_datetime.strftime("%Y%m%d")
-    time_str_url = target_datetime.strftime("%H%M")
-    
-    file_name = f"focos_10min_{date_str_url}_{time_str_url}.csv"
+    file_name = _10min_file_name(target_datetime)
     file_url = f"{CSV_10MIN_BASE_URL}{file_name}"
 
-    ensure_dir(RAW_DATA_DIR) 
+    ensure_dir(RAW_DATA_DIR)
     local_file_path = os.path.join(RAW_DATA_DIR, file_name)
 
-    logging.info(f"Tentando baixar dados de 10min de {target_datetime.strftime('%d/%m/%Y %H:%M')} de: {file_url}")
+    # Um slot de 10min publicado não muda mais: se já foi baixado, não há o que buscar
+    if _has_local_copy(local_file_path):
+        logger.debug("Arquivo de 10min já baixado, usando a cópia local: %s", local_file_path)
+        return local_file_path
+
+    logger.debug("Tentando baixar dados de 10min de %s de: %s", target_datetime.strftime('%d/%m/%Y %H:%M'), file_url)
+    if session is None:
+        session = await get_session()
 
     try:
         async with session.get(file_url, timeout=60) as response:
             response.raise_for_status()
-            async with aiofiles.open(local_file_path, 'wb') as f:
-                while True:
-                    chunk = await response.content.read(8192)
-                    if not chunk:
-                        break
-                    await f.write(chunk)
-
-        logging.info(f"Arquivo de 10min baixado com sucesso e salvo em: {local_file_path}")
+            await _save_response(response, local_file_path)
+
+        logger.debug("Arquivo de 10min baixado com sucesso e salvo em: %s", local_file_path)
         return local_file_path
 
     except aiohttp.ClientResponseError as http_err:
         if http_err.status == 404:
-            logging.warning(f"Arquivo de 10min não encontrado (404) para {target_datetime.strftime('%d/%m/%Y %H:%M')}. URL: {file_url}")
+            logger.warning("Arquivo de 10min não encontrado (404) para %s. URL: %s", target_datetime.strftime('%d/%m/%Y %H:%M'), file_url)
         else:
-            logging.error(f"Erro HTTP ao baixar o arquivo de 10min: {http_err} - URL: {file_url}")
+            logger.error("Erro HTTP ao baixar o arquivo de 10min: %s - URL: %s", http_err, file_url)
         return None
     except aiohttp.ClientConnectionError as conn_err:
-        logging.error(f"Erro de conexão ao tentar baixar o arquivo de 10min: {conn_err} - URL: {file_url}")
+        logger.error("Erro de conexão ao tentar baixar o arquivo de 10min: %s - URL: %s", conn_err, file_url)
         return None
     except asyncio.TimeoutError as timeout_err:
-        logging.error(f"Timeout na requisição ao baixar o arquivo de 10min: {timeout_err} - URL: {file_url}")
+        logger.error("Timeout na requisição ao baixar o arquivo de 10min: %s - URL: %s", timeout_err, file_url)
         return None
     except aiohttp.ClientError as req_err:
-        logging.error(f"Erro geral na requisição ao baixar o arquivo de 10min: {req_err} - URL: {file_url}")
+        logger.error("Erro geral na requisição ao baixar o arquivo de 10min: %s - URL: %s", req_err, file_url)
         return None
     except IOError as io_err:
-        logging.error(f"Erro de I/O ao salvar o arquivo de 10min {local_file_path}: {io_err}")
+        logger.error("Erro de I/O ao salvar o arquivo de 10min %s: %s", local_file_path, io_err)
         return None
 
-async def fetch_all_10min_slots_for_day(target_date: date, session: aiohttp.ClientSession) -> list[str]:
+async def fetch_all_10min_slots_for_day(target_date: date, session: aiohttp.ClientSession | None = None) -> list[str]:
     """
     Tenta baixar todos os 144 arquivos CSV de 10 minutos para um dia específico de forma assíncrona.
     Retorna uma lista de caminhos para os arquivos baixados com sucesso que contêm dados.
     """
     tasks = []
-    logging.info(f"Iniciando download assíncrono de todos os slots de 10min para {target_date.strftime('%Y-%m-%d')}")
+    logger.info("Iniciando download assíncrono de todos os slots de 10min para %s", target_date.strftime('%Y-%m-%d'))
+    if session is None:
+        session = await get_session() # Resolved once so the 144 slots share it
+
+    # Limita os downloads simultâneos: 144 requisições de uma vez provocam erros de conexão no servidor do INPE
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    async def _bounded(slot_dt: datetime) -> str | None:
+        async with sem:
+            return await fetch_10min_fire_csv(slot_dt, session)
+
+    # Com a listagem do diretório só são pedidos os slots publicados (e os que já estão em disco)
+    listed_files = await _list_10min_files(target_date, session)
     for hour in range(24):
         for minute in range(0, 60, 10):
             current_dt = datetime(target_date.year, target_date.month, target_date.day, hour, minute)
-            tasks.append(fetch_10min_fire_csv(current_dt, session))
+            file_name = _10min_file_name(current_dt)
+            if listed_files is not None and file_name not in listed_files \
+                    and not _has_local_copy(os.path.join(RAW_DATA_DIR, file_name)):
+                continue
+            tasks.append(_bounded(current_dt))
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
+    # Os arquivos são verificados enquanto os downloads seguintes ainda estão em andamento: cada slot concluído
+    # vai para a fila, e o validador leva tudo o que já estiver nela numa única ida ao pool de threads
     downloaded_files_with_data = []
-    for result in results:
-        if isinstance(result, str) and os.path.exists(result): # Check if it's a valid path string
+    queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=MAX_CONCURRENT_DOWNLOADS)
+    async def _validator() -> None:
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            paths = [path for path in batch if path is not None]
+            if paths:
+                downloaded_files_with_data.extend(await asyncio.to_thread(_validate_all, paths))
+            if None in batch: # Sentinela: todos os downloads terminaram
+                return
+
+    validator = asyncio.create_task(_validator())
+    try:
+        for next_done in asyncio.as_completed(tasks):
             try:
-                # Asynchronously check file size
-                # Use synchronous os.stat in a thread to avoid blocking
-                file_stat = await asyncio.to_thread(os.stat, result)
-                if file_stat.st_size > 0: # Basic check for non-empty file
-                    # For checking content, pandas is sync. We can run it in a thread
-                    # or read a small chunk async. For simplicity, keeping pandas sync here.
-                    # This is a small, quick operation.
-                    # Using asyncio.to_thread to run synchronous pandas code in a separate thread
-                    df_temp = await asyncio.to_thread(pd.read_csv, result, nrows=1)
-                    if not df_temp.empty:
-                        downloaded_files_with_data.append(result)
-                    else:
-                        logging.info(f"Arquivo {result} parece vazio (sem dados após cabeçalho), ignorando.")
-                else:
-                    logging.info(f"Arquivo {result} está vazio (0 bytes), ignorando.")
+                result = await next_done
             except Exception as e:
-                logging.error(f"Erro ao verificar o arquivo {result}: {e}")
-        elif isinstance(result, Exception):
-            logging.error(f"Erro durante o download de um slot de 10min: {result}")
-            # Depending on the exception, you might want to handle it differently or re-raise
-        # else:
-            # logging.debug(f"Slot não resultou em arquivo válido ou foi None: {result}")
+                logger.error("Erro durante o download de um slot de 10min: %s", e)
+                # Depending on the exception, you might want to handle it differently or re-raise
+                continue
+            if isinstance(result, str):
+                await queue.put(result)
+            # else:
+                # logger.debug("Slot não resultou em arquivo válido ou foi None: %s", result)
+        await queue.put(None)
+        await validator
+    finally:
+        validator.cancel()
+    # Chegam na ordem de conclusão; o nome (data + HHMM) devolve a ordem dos slots
+    downloaded_files_with_data.sort()
 
-
-    logging.info(f"Concluído download para {target_date.strftime('%Y-%m-%d')}. {len(downloaded_files_with_data)} arquivos com dados baixados.")
+    logger.info("Concluído download para %s. %s arquivos com dados baixados.", target_date.strftime('%Y-%m-%d'), len(downloaded_files_with_data))
     return downloaded_files_with_data
 
 async def main_test_runner(): # Wrapper async function for test execution
     """Runs test functions for the collector module."""
-    logging.info("Executando o coletor de dados CSV como script principal (para teste).")
+    logger.info("Executando o coletor de dados CSV como script principal (para teste).")
 
-    async with aiohttp.ClientSession() as session:
+    session = await get_session()
+    try:
         # Test fetch_daily_fire_csv
         target_report_date = date.today() - timedelta(days=1)
-        logging.info(f"Tentando buscar dados para o relatório referente a: {target_report_date.strftime('%d/%m/%Y')}")
+        logger.info("Tentando buscar dados para o relatório referente a: %s", target_report_date.strftime('%d/%m/%Y'))
         downloaded_csv_path = await fetch_daily_fire_csv(target_report_date, session)
         if downloaded_csv_path:
-            logging.info(f"Caminho do arquivo CSV diário baixado: {downloaded_csv_path}")
+            logger.info("Caminho do arquivo CSV diário baixado: %s", downloaded_csv_path)
             try:
                 # Use synchronous os.stat in a thread
                 stat_info = await asyncio.to_thread(os.stat, downloaded_csv_path)
-                logging.info(f"Tamanho do arquivo: {stat_info.st_size / 1024:.2f} KB")
+                logger.info("Tamanho do arquivo: %.2f KB", stat_info.st_size / 1024)
             except Exception as e:
-                logging.error(f"Não foi possível obter o tamanho do arquivo {downloaded_csv_path}: {e}")
+                logger.error("Não foi possível obter o tamanho do arquivo %s: %s", downloaded_csv_path, e)
 
         else:
-            logging.warning("Falha ao baixar o arquivo CSV diário.")
+            logger.warning("Falha ao baixar o arquivo CSV diário.")
 
         # Test fetch_10min_fire_csv
-        logging.info("\nTestando fetch_10min_fire_csv individual:")
+        logger.info("\nTestando fetch_10min_fire_csv individual:")
         # Use uma data/hora que você espera que tenha dados, ou uma recente para teste.
         # Ex: duas horas atrás, no minuto 00, 10, 20, 30, 40, ou 50.
         test_datetime_10min = (datetime.now() - timedelta(hours=2)).replace(minute=0, second=0, microsecond=0)
         downloaded_10min_path = await fetch_10min_fire_csv(test_datetime_10min, session)
         if downloaded_10min_path:
-            logging.info(f"Caminho do arquivo de 10min baixado: {downloaded_10min_path}")
+            logger.info("Caminho do arquivo de 10min baixado: %s", downloaded_10min_path)
         else:
-            logging.warning(f"Falha ao baixar arquivo de 10min para {test_datetime_10min.strftime('%d/%m/%Y %H:%M')}.")
+            logger.warning("Falha ao baixar arquivo de 10min para %s.", test_datetime_10min.strftime('%d/%m/%Y %H:%M'))
 
         # Test fetch_all_10min_slots_for_day
-        logging.info("\nTestando fetch_all_10min_slots_for_day:")
+        logger.info("\nTestando fetch_all_10min_slots_for_day:")
         # Fetch for a date that is likely to have data, e.g., 2 days ago
         target_date_for_10min_slots = date.today() - timedelta(days=2)
         downloaded_slot_files = await fetch_all_10min_slots_for_day(target_date_for_10min_slots, session)
-        logging.info(f"Total de {len(downloaded_slot_files)} arquivos de slots de 10min baixados com dados para {target_date_for_10min_slots}.")
+        logger.info("Total de %s arquivos de slots de 10min baixados com dados para %s.", len(downloaded_slot_files), target_date_for_10min_slots)
         # for f_path in downloaded_slot_files:
-        #     logging.debug(f" - {f_path}")
+        #     logger.debug(" - %s", f_path)
+    finally:
+        await close_session()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
     # Para executar o script de teste:
     # python -m data_collection.collector (se estiver na raiz do projeto)
     # ou python collector.py (se estiver dentro da pasta data_collection)
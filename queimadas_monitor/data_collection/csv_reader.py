@@ -0,0 +1,105 @@
+# Módulo para leitura dos arquivos CSV de focos de queimadas do INPE
+# Sem chamadas ao Streamlit: as funções podem rodar em threads ou em processos separados.
+
+import codecs
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+# Timestamp formats used by INPE: daily files separate date and time with a space, 10-min files with 'T'
+INPE_TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+
+def _sniff_encoding(csv_path: str, sample_size: int = 4096) -> str:
+    """
+    Tells UTF-8 from latin1 (the only encodings INPE uses) from the first bytes of a CSV file.
+    General-purpose detectors are not used: on Portuguese text they guess codecs like cp1250 that decode
+    without error but corrupt names ("SÃO" -> "SĂO").
+    """
+    with open(csv_path, 'rb') as f:
+        head = f.read(sample_size)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False: the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return 'latin1'
+    # A latin1 byte after the sample makes PyArrow fail and read_table falls back to pandas, then latin1
+    return 'utf8'
+
+# Common date/time and coordinate column names in INPE files, mapped to the names used by the app
+POSSIBLE_DATE_COLS = {'datahora': 'event_datetime', 'data_hora_gmt': 'event_datetime', 'data': 'event_datetime'}
+COORD_COLS = {'latitude': 'lat', 'longitude': 'lon'}
+
+def _standardize_column_names(table: pa.Table) -> pa.Table:
+    """Renames date/time and coordinate columns so tables from different files line up when concatenated."""
+    renames = {**POSSIBLE_DATE_COLS, **COORD_COLS}
+    return table.rename_columns([renames.get(name, name) for name in table.column_names])
+
+def _read_csv_arrow(csv_path: str, encoding: str) -> pa.Table:
+    """Reads a CSV with PyArrow's multithreaded parser."""
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=8 << 20, encoding=encoding)
+    parse_options = pacsv.ParseOptions(delimiter=',')
+    # Empty cells are nulls, as in pandas: a blank 'bioma' must not count as a known biome
+    convert_options = pacsv.ConvertOptions(timestamp_parsers=INPE_TIMESTAMP_FORMATS, strings_can_be_null=True)
+    table = pacsv.read_csv(csv_path, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+    # Text that is not valid in the given encoding is not an error for PyArrow: the column comes back as binary
+    if any(pa.types.is_binary(field.type) for field in table.schema):
+        raise pa.ArrowInvalid(f"CSV contains text that is not valid {encoding}")
+    return table
+
+NUMERIC_COLS = ('lat', 'lon', 'latitude', 'longitude', 'frp')
+
+def _read_csv_pandas(csv_path: str, encoding: str) -> pd.DataFrame:
+    """Reads a CSV with pandas' C parser from a memory-mapped file; unparseable numbers become NaN."""
+    # An empty file cannot be memory-mapped: report it the way pandas does for an empty CSV
+    if os.path.getsize(csv_path) == 0:
+        raise pd.errors.EmptyDataError("No columns to parse from file")
+    df = pd.read_csv(csv_path, encoding=encoding, memory_map=True, engine='c', low_memory=False, cache_dates=True)
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce', downcast='float')
+    # Parse timestamps as PyArrow's timestamp_parsers would (timestamp[s]), so tables from both readers concatenate
+    for col in POSSIBLE_DATE_COLS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            for fmt in INPE_TIMESTAMP_FORMATS:
+                try:
+                    df[col] = pd.to_datetime(df[col], format=fmt).astype('datetime64[s]')
+                    break
+                except (ValueError, TypeError):
+                    continue # Like PyArrow, a column that matches no format stays as text
+    return df
+
+def read_table(csv_path: str) -> pa.Table:
+    """
+    Reads a CSV file into a PyArrow Table, falling back to pandas when PyArrow cannot parse it.
+    Makes no Streamlit calls and raises on failure, so it is safe to run in a thread.
+    """
+    encoding = _sniff_encoding(csv_path)
+    try:
+        return _standardize_column_names(_read_csv_arrow(csv_path, encoding))
+    except pa.ArrowInvalid:
+        # PyArrow could not parse the file (bad encoding guess, ragged rows, empty file...): use pandas.
+        try:
+            df = _read_csv_pandas(csv_path, encoding)
+        except UnicodeDecodeError:
+            # Only reachable when the sampled bytes were plain ASCII and read as UTF-8:
+            # the rest of the file is not UTF-8, and INPE files then use 'latin1'
+            df = _read_csv_pandas(csv_path, 'latin1')
+        return _standardize_column_names(pa.Table.from_pandas(df, preserve_index=False))
+
+def read_table_ipc(csv_path: str) -> pa.Buffer:
+    """
+    read_table serialized as an Arrow IPC stream, for worker processes: the buffer crosses the
+    process boundary as raw bytes instead of a pickled table. Decode with table_from_ipc.
+    """
+    table = read_table(csv_path)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def table_from_ipc(buffer: pa.Buffer) -> pa.Table:
+    """Inverse of read_table_ipc."""
+    return pa.ipc.open_stream(buffer).read_all()
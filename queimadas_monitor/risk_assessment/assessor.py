@@ -1,14 +1,20 @@
 # risk_assessment/assessor.py
 # Módulo para avaliação de risco de focos de queimadas
 
+import numpy as np
 import pandas as pd
 import geopandas
+import numba
+from numba import njit, prange
+import shapely
 from shapely.geometry import Point
+from shapely.strtree import STRtree
 import os # Added for path joining
+import threading
 
 # Tentativa de importar configurações.
 try:
-    from config import RISK_FRP_THRESHOLD, SENSITIVE_BIOMES, BIOMES_FILE_PATH
+    from config import RISK_FRP_THRESHOLD, SENSITIVE_BIOMES, BIOMES_FILE_PATH, RISK_LEVELS, RAW_DATA_DIR
 except ModuleNotFoundError:
     import sys
     # Adiciona o diretório pai ao sys.path para encontrar o módulo config
@@ -16,12 +22,48 @@ except ModuleNotFoundError:
     project_root_dir = os.path.dirname(current_file_dir)
     if project_root_dir not in sys.path:
         sys.path.append(project_root_dir)
-    from config import RISK_FRP_THRESHOLD, SENSITIVE_BIOMES, BIOMES_FILE_PATH
+    from config import RISK_FRP_THRESHOLD, SENSITIVE_BIOMES, BIOMES_FILE_PATH, RISK_LEVELS, RAW_DATA_DIR
+
+# Conjuntos para testes de pertinência em O(1)
+_SENSITIVE_BIOMES = frozenset(SENSITIVE_BIOMES)
+CRITICAL_BIOMES = frozenset(("Amazônia", "Pantanal")) # Biomas sensíveis em que FRP elevado torna o foco Crítico
 
 # --- Global variable to hold loaded biomes data ---
 # This will be loaded once when the module is first imported.
 BIOMES_GDF = None
 BIOME_NAME_COLUMN = 'nom_bioma' # IMPORTANT: Adjust this to the actual column name in your GeoJSON that contains the biome name
+BIOMES_CACHE_FILE = 'biomes_cache.pkl' # Parsed biomes, saved in RAW_DATA_DIR so later starts skip the GeoJSON
+# Point-in-biome lookups go straight to the biome geometries (prepared for repeated containment tests) and a
+# Shapely STRtree over them, with the names in a parallel array (index i -> _BIOME_NAMES[i]), so queries involve
+# no GeoDataFrame access
+_BIOME_GEOMS: np.ndarray | None = None
+_BIOME_TREE: STRtree | None = None
+_BIOME_NAMES: np.ndarray | None = None
+_BIOME_BOUNDS: np.ndarray | None = None # (n_biomes, 4) bounding boxes as (minx, miny, maxx, maxy)
+
+def _build_biome_index() -> None:
+    """Builds the lookup structures above from BIOMES_GDF (positional order is kept: first polygon wins)."""
+    global _BIOME_GEOMS, _BIOME_TREE, _BIOME_NAMES, _BIOME_BOUNDS
+    _BIOME_GEOMS = np.asarray(BIOMES_GDF.geometry.values)
+    shapely.prepare(_BIOME_GEOMS)
+    _BIOME_TREE = STRtree(BIOMES_GDF.geometry.values)
+    _BIOME_BOUNDS = shapely.bounds(BIOMES_GDF.geometry.values)
+    _BIOME_NAMES = BIOMES_GDF[BIOME_NAME_COLUMN].to_numpy(dtype=object)
+
+def _read_biomes_cache(cache_path: str, source_mtime: float) -> geopandas.GeoDataFrame | None:
+    """Returns the cached biomes if the cache was written from the GeoJSON as it is now (same mtime)."""
+    try:
+        cached_mtime, gdf = pd.read_pickle(cache_path)
+    except Exception:
+        return None # Missing or unreadable cache: parse the GeoJSON
+    return gdf if cached_mtime == source_mtime else None
+
+def _write_biomes_cache(cache_path: str, source_mtime: float, gdf: geopandas.GeoDataFrame) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        pd.to_pickle((source_mtime, gdf), cache_path)
+    except Exception as e:
+        print(f"Warning: could not write the biomes cache to {cache_path}: {e}")
 
 def load_biomes_data():
     """Loads the biomes GeoJSON into a GeoDataFrame."""
@@ -40,8 +82,17 @@ def load_biomes_data():
                 BIOMES_GDF = geopandas.GeoDataFrame() # Empty GeoDataFrame
                 return
 
+            cache_path = os.path.join(project_root, RAW_DATA_DIR, BIOMES_CACHE_FILE)
+            source_mtime = os.path.getmtime(full_GeoJSON_path)
+            cached_gdf = _read_biomes_cache(cache_path, source_mtime)
+            if cached_gdf is not None:
+                BIOMES_GDF = cached_gdf
+                _build_biome_index()
+                print(f"Biomes data loaded from cache: {cache_path}")
+                return
+
             print(f"Loading biomes data from: {full_GeoJSON_path}")
-            BIOMES_GDF = geopandas.read_file(full_GeoJSON_path)
+            BIOMES_GDF = geopandas.read_file(full_GeoJSON_path, engine="pyogrio")
             # Ensure the GeoDataFrame is using WGS84 (lat/lon) if your points are
             if BIOMES_GDF.crs is None:
                 print("Warning: Biomes GeoDataFrame has no CRS defined. Assuming WGS84 (EPSG:4326).")
@@ -56,6 +107,8 @@ def load_biomes_data():
                 BIOMES_GDF = geopandas.GeoDataFrame() # Make it empty to prevent further errors
                 return
 
+            _build_biome_index()
+            _write_biomes_cache(cache_path, source_mtime, BIOMES_GDF)
             print("Biomes data loaded successfully.")
         except Exception as e:
             print(f"Error loading biomes GeoJSON: {e}")
@@ -77,23 +130,61 @@ def get_biome_from_lat_lon(lat: float, lon: float) -> str | None:
         
     try:
         point = Point(lon, lat) # Shapely Point: (longitude, latitude)
-        # Iterate through biomes and check if the point is within any
-        for index, row in BIOMES_GDF.iterrows():
-            if point.within(row['geometry']):
-                return row[BIOME_NAME_COLUMN] # Use the configured biome name column
+        # Only biomes whose bounding box holds the point are candidates; test them in file order so the first wins
+        for i in np.sort(_BIOME_TREE.query(point)):
+            if shapely.contains_xy(_BIOME_GEOMS[i], lon, lat):
+                return _BIOME_NAMES[i]
     except Exception as e:
         print(f"Error in get_biome_from_lat_lon for point ({lon}, {lat}): {e}")
     return None
 
 
-def assess_foco_criticidade(foco: pd.Series) -> tuple[str, list[str]]:
+def _first_biome_idx(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """
+    For each point, the lowest index of a biome containing it, or len(_BIOME_NAMES) if none does.
+    A point on a shared border falls in several biomes: the first one wins, as in the per-point lookup.
+    """
+    # contains_xy on the prepared polygons is far faster than the STRtree 'within' predicate, which tests the
+    # unprepared ones; each polygon only sees the still unresolved points inside its bounding box
+    not_found = len(_BIOME_NAMES)
+    first = np.full(len(lons), not_found, dtype=np.intp)
+    for i, (minx, miny, maxx, maxy) in enumerate(_BIOME_BOUNDS):
+        candidates = np.flatnonzero((first == not_found) & (lons >= minx) & (lons <= maxx) & (lats >= miny) & (lats <= maxy))
+        if candidates.size:
+            first[candidates[shapely.contains_xy(_BIOME_GEOMS[i], lons[candidates], lats[candidates])]] = i
+    return first
+
+def get_biomes_from_points(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Vectorized get_biome_from_lat_lon: one prepared containment test per biome for all points.
+    Returns an object array with the biome name of each point, or None where not found.
+    """
+    biomes = np.full(len(lats), None, dtype=object)
+    if BIOMES_GDF is None or BIOMES_GDF.empty:
+        return biomes
+    # Points outside every biome (e.g. offshore or outside Brazil) are rejected by the bounding box checks
+    # in _first_biome_idx, before any polygon test
+    valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+    if valid.size == 0:
+        return biomes
+    try:
+        first = _first_biome_idx(lons[valid], lats[valid])
+        found = first < len(_BIOME_NAMES)
+        biomes[valid[found]] = _BIOME_NAMES[first[found]]
+    except Exception as e:
+        print(f"Error in get_biomes_from_points: {e}")
+    return biomes
+
+
+def assess_foco_criticidade(foco) -> tuple[str, list[str]]:
     """
     Avalia a criticidade de um único foco de queimada.
     Agora utiliza lat/lon para determinar o bioma se a coluna 'bioma' não estiver presente ou for NaN.
 
     Args:
-        foco (pd.Series): Uma linha do DataFrame representando um foco de queimada.
-                          Espera-se que contenha colunas como 'frp', 'lat', 'lon'.
+        foco (pd.Series | tuple): Uma linha do DataFrame representando um foco de queimada, como Series ou
+                          (mais leve) namedtuple de df.itertuples(index=False); os campos são lidos por atributo.
+                          Espera-se que contenha colunas como 'frp' (numérico, NaN quando ausente), 'lat', 'lon'.
                           A coluna 'bioma' é opcional.
 
     Returns:
@@ -102,35 +193,34 @@ def assess_foco_criticidade(foco: pd.Series) -> tuple[str, list[str]]:
     """
     razoes = []
     nivel_criticidade_num = 0 # Começa com Baixo
-    # Determinar o bioma
+    # Determinar o bioma (plain checks instead of pd.notna on scalars: a name is a str, NaN != NaN, and
+    # pd.NA - used by aplica_avaliacao_risco_df for missing columns - must be excluded before comparing)
     determined_biome = None
-    if 'bioma' in foco and pd.notna(foco['bioma']):
-        determined_biome = foco['bioma']
-    elif 'lat' in foco and 'lon' in foco and pd.notna(foco['lat']) and pd.notna(foco['lon']):
-        determined_biome = get_biome_from_lat_lon(foco['lat'], foco['lon'])
+    bioma, lat, lon = getattr(foco, 'bioma', None), getattr(foco, 'lat', None), getattr(foco, 'lon', None)
+    if isinstance(bioma, str):
+        determined_biome = bioma
+    elif lat is not None and lat is not pd.NA and lat == lat and lon is not None and lon is not pd.NA and lon == lon:
+        determined_biome = get_biome_from_lat_lon(lat, lon)
         if determined_biome:
             razoes.append(f"Bioma determinado por geolocalização: {determined_biome}")
     
     # Critério 1: FRP
-    if 'frp' in foco and pd.notna(foco['frp']):
-        try:
-            frp_valor = float(foco['frp'])
-            if frp_valor >= RISK_FRP_THRESHOLD:
-                razoes.append(f"FRP elevado ({frp_valor:.2f} MW >= {RISK_FRP_THRESHOLD} MW)")
-                nivel_criticidade_num = max(nivel_criticidade_num, 2) # Define como Alto
-            elif frp_valor >= RISK_FRP_THRESHOLD / 2: 
-                nivel_criticidade_num = max(nivel_criticidade_num, 1) 
-        except ValueError:
-            pass 
+    frp_valor = getattr(foco, 'frp', None) # Already numeric: aplica_avaliacao_risco_df casts the column once on entry
+    if frp_valor is not None and frp_valor is not pd.NA and frp_valor == frp_valor:
+        if frp_valor >= RISK_FRP_THRESHOLD:
+            razoes.append(f"FRP elevado ({frp_valor:.2f} MW >= {RISK_FRP_THRESHOLD} MW)")
+            nivel_criticidade_num = max(nivel_criticidade_num, 2) # Define como Alto
+        elif frp_valor >= RISK_FRP_THRESHOLD / 2: 
+            nivel_criticidade_num = max(nivel_criticidade_num, 1) 
 
     # Critério 2: Bioma Sensível (usando determined_biome)
     if determined_biome: # Check if a biome was determined
-        if determined_biome in SENSITIVE_BIOMES:
+        if determined_biome in _SENSITIVE_BIOMES:
             # Add reason only if not already added by geolocalization message
             if not any(f"Bioma determinado por geolocalização: {determined_biome}" in r for r in razoes):
                  razoes.append(f"Bioma sensível ({determined_biome})")
 
-            if nivel_criticidade_num >= 2 and determined_biome in ["Amazônia", "Pantanal"]:
+            if nivel_criticidade_num >= 2 and determined_biome in CRITICAL_BIOMES:
                  nivel_criticidade_num = max(nivel_criticidade_num, 3) 
             else:
                 nivel_criticidade_num = max(nivel_criticidade_num, 1) 
@@ -152,6 +242,60 @@ def assess_foco_criticidade(foco: pd.Series) -> tuple[str, list[str]]:
 
     return criticidade_label, razoes
 
+# TBB (the layer numba picks first when installed) can hang the interpreter at shutdown after being
+# used from Streamlit's script threads; prefer OpenMP and keep the others as fallbacks.
+numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+# Without OpenMP or TBB numba falls back to 'workqueue', which aborts the process if two threads (two Streamlit
+# sessions) run a parallel kernel at the same time; calls to the kernel are serialized to stay safe on any layer.
+_KERNEL_LOCK = threading.Lock()
+
+# Criticidade como categoria ordenada pelo nível numérico de RISK_LEVELS: o código da categoria é o próprio nível
+CRITICIDADE_DTYPE = pd.CategoricalDtype(sorted(RISK_LEVELS, key=RISK_LEVELS.get), ordered=True)
+
+@njit(parallel=True, cache=True)
+def _assess_levels(frp, biome_codes, sensitive_lut, critical_lut, threshold):
+    """
+    Calcula o nível de criticidade (0 a 3) de cada foco, com a mesma regra de assess_foco_criticidade.
+    frp contém NaN quando ausente; biome_codes indexa sensitive_lut/critical_lut (-1 = bioma desconhecido).
+    """
+    out = np.empty(frp.size, np.int8)
+    for i in prange(frp.size):
+        level = 0
+        frp_valor = frp[i]
+        if frp_valor >= threshold: # Comparações com NaN são falsas
+            level = 2
+        elif frp_valor >= threshold / 2:
+            level = 1
+        code = biome_codes[i]
+        if code >= 0 and sensitive_lut[code]:
+            if level >= 2 and critical_lut[code]:
+                level = 3
+            elif level < 1:
+                level = 1
+        out[i] = level
+    return out
+
+def _build_razoes(levels: np.ndarray, frp: np.ndarray, biomes: np.ndarray, geolocated: np.ndarray, sensitive: np.ndarray) -> list[list[str]]:
+    """
+    Monta a lista de razões de cada foco a partir dos resultados já calculados para o DataFrame inteiro.
+    Cada texto é gerado só para os focos em que a máscara correspondente é verdadeira.
+    """
+    n = levels.size
+    high = frp >= RISK_FRP_THRESHOLD # NaN nunca é elevado
+    sensitive_only = sensitive & ~geolocated # Bioma geolocalizado já é citado na primeira razão
+    geo_txt = np.full(n, None, dtype=object)
+    geo_txt[geolocated] = [f"Bioma determinado por geolocalização: {biome}" for biome in biomes[geolocated]]
+    frp_txt = np.full(n, None, dtype=object)
+    frp_txt[high] = [f"FRP elevado ({frp_valor:.2f} MW >= {RISK_FRP_THRESHOLD} MW)" for frp_valor in frp[high]]
+    sensitive_txt = np.full(n, None, dtype=object)
+    sensitive_txt[sensitive_only] = [f"Bioma sensível ({biome})" for biome in biomes[sensitive_only]]
+    defaults = np.where(levels > 0, "Critério de risco atingido (detalhe não especificado)",
+                        "Nenhum critério de risco específico atingido").tolist()
+    return [
+        [texto for texto in textos if texto is not None] or [default]
+        for *textos, default in zip(geo_txt, frp_txt, sensitive_txt, defaults)
+    ]
+
 def aplica_avaliacao_risco_df(df: pd.DataFrame) -> pd.DataFrame:
     """Aplica a avaliação de risco a cada foco no DataFrame."""
     if BIOMES_GDF is None or BIOMES_GDF.empty:
@@ -161,7 +305,7 @@ def aplica_avaliacao_risco_df(df: pd.DataFrame) -> pd.DataFrame:
 
     if df.empty:
         df_com_risco = df.copy()
-        df_com_risco['criticidade'] = pd.Series(dtype='object')
+        df_com_risco['criticidade'] = pd.Series(dtype=CRITICIDADE_DTYPE)
         df_com_risco['razoes_criticidade'] = pd.Series(dtype='object')
         # Add determined_biome column if biomes data is available, even for empty df
         if BIOMES_GDF is not None and not BIOMES_GDF.empty:
@@ -173,20 +317,50 @@ def aplica_avaliacao_risco_df(df: pd.DataFrame) -> pd.DataFrame:
     if 'frp' not in df.columns: df['frp'] = pd.NA
     if 'lat' not in df.columns: df['lat'] = pd.NA
     if 'lon' not in df.columns: df['lon'] = pd.NA
-    # 'bioma' column is optional, will be handled by assess_foco_criticidade
+    # FRP as float64 once, unparseable values becoming NaN, so no per-row float() parsing is needed
+    df['frp'] = pd.to_numeric(df['frp'], errors='coerce')
+    # 'bioma' column is optional: the biome then comes from the spatial join below
+
+    # Determine the biome: the 'bioma' column when present, otherwise geolocation from lat/lon
+    if 'bioma' in df.columns:
+        biome = df['bioma'].astype(object).where(df['bioma'].notna(), None)
+    else:
+        biome = pd.Series(None, index=df.index, dtype=object)
+    lats = pd.to_numeric(df['lat'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    lons = pd.to_numeric(df['lon'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    # Only rows without a 'bioma' are geolocated; an already assessed frame brings its result along in 'determined_biome_geo'
+    needs_geo = biome.isna() & df['lat'].notna() & df['lon'].notna()
+    needs_geo_mask = needs_geo.to_numpy()
+    if 'determined_biome_geo' in df.columns:
+        biome_geo = df['determined_biome_geo'].astype(object).where(df['determined_biome_geo'].notna(), None).to_numpy()
+    else:
+        biome_geo = np.full(len(df), None, dtype=object)
+        if needs_geo_mask.any():
+            biome_geo[needs_geo_mask] = get_biomes_from_points(lats[needs_geo_mask], lons[needs_geo_mask])
+    if needs_geo_mask.any():
+        biome.loc[needs_geo] = biome_geo[needs_geo_mask]
+    geolocated = (needs_geo & biome.notna()).to_numpy()
+
+    # Assess all rows at once: numeric FRP + integer biome codes into the compiled kernel
+    # float64, as the per-row rule: float32 would move values next to the thresholds and change the FRP shown in the reasons
+    frp = df['frp'].to_numpy(dtype=np.float64, na_value=np.nan)
+    biome_cat = pd.Categorical(biome)
+    sensitive_lut = biome_cat.categories.isin(_SENSITIVE_BIOMES)
+    critical_lut = biome_cat.categories.isin(CRITICAL_BIOMES)
+    biome_codes = biome_cat.codes
+    with _KERNEL_LOCK:
+        levels = _assess_levels(frp, biome_codes, sensitive_lut, critical_lut, RISK_FRP_THRESHOLD)
+    # Rows without a biome (code -1) are never sensitive; with no biome at all the lookup table is empty
+    sensitive = np.zeros(len(levels), dtype=bool)
+    has_biome = biome_codes >= 0
+    sensitive[has_biome] = sensitive_lut[biome_codes[has_biome]]
 
-    # Apply assessment
-    avaliacoes = df.apply(assess_foco_criticidade, axis=1, result_type='expand')
     df_com_risco = df.copy() 
-    df_com_risco[['criticidade', 'razoes_criticidade']] = avaliacoes
+    df_com_risco['criticidade'] = pd.Categorical.from_codes(levels, dtype=CRITICIDADE_DTYPE)
+    df_com_risco['razoes_criticidade'] = _build_razoes(levels, frp, biome.to_numpy(), geolocated, sensitive)
 
-    # Optionally, add a column with the biome determined by geolocation if it's different or new
-    # This is more for debugging or explicit display if needed
+    # Column with the biome determined by geolocation (the same lookup used above, None where 'bioma' was given)
     if BIOMES_GDF is not None and not BIOMES_GDF.empty:
         if 'lat' in df_com_risco.columns and 'lon' in df_com_risco.columns:
-            df_com_risco['determined_biome_geo'] = df_com_risco.apply(
-                lambda row: get_biome_from_lat_lon(row['lat'], row['lon']) 
-                if pd.notna(row['lat']) and pd.notna(row['lon']) else None, 
-                axis=1
-            )
+            df_com_risco['determined_biome_geo'] = biome_geo
     return df_com_risco
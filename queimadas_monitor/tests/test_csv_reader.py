@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Tests run from the repository root or from queimadas_monitor/: make the project modules importable either way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_collection.csv_reader import read_table
+from risk_assessment.assessor import aplica_avaliacao_risco_df
+
+
+def test_blank_bioma_is_null_and_geolocated(tmp_path):
+    csv_path = tmp_path / "focos.csv"
+    csv_path.write_text(
+        "lat,lon,frp,bioma,estado,datahora\n"
+        "-3.1,-60.0,120.0,,AMAZONAS,2024-08-01 10:00:00\n"
+        "-15.8,-47.9,10.0,Cerrado,,2024-08-01 11:00:00\n",
+        encoding="utf-8",
+    )
+    df = read_table(str(csv_path)).to_pandas()
+    assert df["bioma"].isna().tolist() == [True, False]
+    assert df["estado"].isna().tolist() == [False, True]
+
+    assessed = aplica_avaliacao_risco_df(df)
+    assert assessed.loc[0, "criticidade"] == "Crítico"
+    assert "Bioma determinado por geolocalização: Amazônia" in assessed.loc[0, "razoes_criticidade"]